@@ -12,6 +12,12 @@ import math
 import requests
 from datetime import datetime
 from pathlib import Path
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows (dev local)
+    fcntl = None
 
 import edge_tts
 import asyncio
@@ -36,6 +42,60 @@ MEDIA_DIR = Path('media')
 for directory in [PRODUCTIONS_DIR, OUTPUT_DIR, SEGMENTS_DIR, MEDIA_DIR]:
     directory.mkdir(exist_ok=True)
 
+# Estado compartilhado com workflow_manager/manage_downloads; o .lock é
+# um sidecar porque o .json troca de inode a cada rename atômico
+PENDING_FILE = Path('productions/pending_downloads.json')
+PENDING_LOCK_FILE = Path('productions/pending_downloads.lock')
+
+
+@contextmanager
+def pending_lock():
+    """Lock exclusivo para read-modify-write de pending_downloads.json.
+
+    Serializa este job contra um /confirm ou /cleanup rodando em outro
+    job sobre o mesmo arquivo.
+    """
+    fd = os.open(PENDING_LOCK_FILE, os.O_CREAT | os.O_RDWR)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+def read_pending():
+    """Lê o JSON de pendentes (chamar sob pending_lock)"""
+    if not PENDING_FILE.exists():
+        return {}
+    with open(PENDING_FILE, 'r') as f:
+        return json.load(f)
+
+
+def write_pending(pending):
+    """Persiste via .tmp + os.replace (chamar sob pending_lock).
+
+    Leitores concorrentes nunca veem o JSON pela metade. Compacto por
+    padrão, como nos outros módulos; PENDING_PRETTY=1 reativa o indent.
+    """
+    if os.environ.get('PENDING_PRETTY'):
+        payload = json.dumps(pending, indent=2)
+    else:
+        payload = json.dumps(pending, separators=(',', ':'))
+
+    tmp = PENDING_FILE.with_suffix('.json.tmp')
+    try:
+        tmp.write_text(payload)
+        os.replace(tmp, PENDING_FILE)
+    except Exception:
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+
 class WorkflowCancelled(Exception):
     """Exception raised when workflow is cancelled by user"""
     pass
@@ -558,27 +618,22 @@ class VideoProducer:
             )
             return False
         
-        # Salva informações do download pendente
-        pending_file = Path('productions/pending_downloads.json')
-        pending_downloads = {}
-        
-        if pending_file.exists():
-            with open(pending_file, 'r') as f:
-                pending_downloads = json.load(f)
-        
-        pending_downloads[video_id] = {
-            "video_path": str(video_path),
-            "download_url": download_url,
-            "release_tag": release_tag,
-            "youtube_url": youtube_url,
-            "title": self.title,
-            "size_mb": video_size_mb,
-            "timestamp": datetime.now().isoformat(),
-            "confirmed": False
-        }
-        
-        with open(pending_file, 'w') as f:
-            json.dump(pending_downloads, f, indent=2)
+        # Salva informações do download pendente (sob lock, para não
+        # perder a entrada se um /confirm ou /cleanup salvar junto)
+        with pending_lock():
+            pending_downloads = read_pending()
+            pending_downloads[video_id] = {
+                "video_path": str(video_path),
+                "download_url": download_url,
+                "release_tag": release_tag,
+                "youtube_url": youtube_url,
+                "title": self.title,
+                "size_mb": video_size_mb,
+                "timestamp": datetime.now().isoformat(),
+                "ts_epoch": time.time(),
+                "confirmed": False
+            }
+            write_pending(pending_downloads)
         
         # Monta mensagem
         message = f"""🎉 <b>VÍDEO PUBLICADO NO YOUTUBE!</b>
@@ -696,35 +751,33 @@ class VideoProducer:
         Processa a confirmação de download e remove o vídeo + release
         """
         print(f"\n✅ Confirmação recebida para: {video_id}")
-        
-        pending_file = Path('productions/pending_downloads.json')
-        
-        if not pending_file.exists():
+
+        if not PENDING_FILE.exists():
             self.telegram.send_message(
                 "❌ <b>Erro</b>\n\n"
                 "Lista de downloads não encontrada."
             )
             return False
-        
-        with open(pending_file, 'r') as f:
-            pending_downloads = json.load(f)
-        
-        if video_id not in pending_downloads:
+
+        # Retira a entrada da lista num read-modify-write sob lock;
+        # remoções de arquivo/release e mensagens ficam fora dele
+        with pending_lock():
+            pending_downloads = read_pending()
+            video_info = pending_downloads.pop(video_id, None)
+            if video_info is not None:
+                write_pending(pending_downloads)
+
+        if video_info is None:
             self.telegram.send_message(
                 "❌ <b>ID Inválido</b>\n\n"
                 f"Vídeo {video_id} não encontrado.\n"
                 "Verifique o ID e tente novamente."
             )
             return False
-        
-        video_info = pending_downloads[video_id]
+
         video_path = video_info['video_path']
         release_tag = video_info.get('release_tag')
-        
-        # Marca como confirmado
-        video_info['confirmed'] = True
-        video_info['confirmed_at'] = datetime.now().isoformat()
-        
+
         # Remove o arquivo do vídeo
         removed_file = False
         if os.path.exists(video_path):
@@ -791,13 +844,7 @@ class VideoProducer:
                 "⚠️ Arquivos já foram removidos\n"
                 "✨ Produção completa!"
             )
-        
-        # Remove da lista de pendentes
-        del pending_downloads[video_id]
-        
-        with open(pending_file, 'w') as f:
-            json.dump(pending_downloads, f, indent=2)
-        
+
         return True
 
     
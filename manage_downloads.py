@@ -6,22 +6,88 @@ Pode ser executado manualmente ou via comando Telegram
 
 import os
 import json
-import requests
-from datetime import datetime, timedelta
+import time
+import bisect
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 TELEGRAM_BOT_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN')
 TELEGRAM_CHAT_ID = os.environ.get('TELEGRAM_CHAT_ID')
 PENDING_FILE = Path('productions/pending_downloads.json')
+LOCK_FILE = Path('productions/pending_downloads.lock')
+
+# Template de cada entrada em list_pending, compilado uma vez no import
+_ENTRY_TMPL = (
+    "🎬 <b>{title}</b>\n"
+    "🆔 ID: <code>{vid}</code>\n"
+    "📦 Tamanho: {size:.1f}MB\n"
+    "⏰ Criado: {d}d {h}h atrás\n"
+    "📊 Status: {status}\n"
+    "🔗 <a href='{url}'>Download</a>\n"
+    "─────────────────\n\n"
+)
+
+# Teclado fixo de list_pending, serializado uma única vez no import
+_CLEANUP_KEYBOARD_JSON = json.dumps({
+    "inline_keyboard": [
+        [{"text": "🗑️ Limpar Confirmados", "callback_data": "cleanup_confirmed"}],
+        [{"text": "⚠️ Limpar Expirados (>24h)", "callback_data": "cleanup_expired"}]
+    ]
+})
 
 
 class DownloadManager:
     def __init__(self):
+        # Import adiado: invocações que nem chegam a falar com o
+        # Telegram (fast path do list) não pagam o custo de carregar
+        # requests/urllib3/ssl
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
         self.base_url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}"
         self.chat_id = TELEGRAM_CHAT_ID
-    
-    def send_message(self, text, reply_markup=None):
-        """Envia mensagem pelo Telegram"""
+
+        # Sessão persistente: reusa a mesma conexão TLS em todas as mensagens
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=4,
+            max_retries=Retry(
+                total=3,
+                backoff_factor=0.3,
+                status_forcelist=[429, 500, 502, 503, 504]
+            )
+        )
+        self.session.mount('https://', adapter)
+
+        # Cache em memória da lista de pendentes (carregada sob demanda)
+        self._pending = None
+        self._by_status = {'confirmed': [], 'pending_sorted_by_ts': []}
+        self._last_hash = None
+
+    def close(self):
+        """Fecha a sessão HTTP"""
+        self.session.close()
+
+    def send_message(self, text, reply_markup=None, *, parse_response=False):
+        """Envia mensagem pelo Telegram.
+
+        Por padrão não parseia o corpo da resposta (nenhum chamador usa);
+        devolve apenas response.ok e libera a conexão para o pool.
+        """
         url = f"{self.base_url}/sendMessage"
         data = {
             'chat_id': self.chat_id,
@@ -29,209 +95,392 @@ class DownloadManager:
             'parse_mode': 'HTML'
         }
         if reply_markup:
-            data['reply_markup'] = json.dumps(reply_markup)
-        
+            # Aceita JSON já serializado (teclados fixos) ou dict
+            if isinstance(reply_markup, str):
+                data['reply_markup'] = reply_markup
+            else:
+                data['reply_markup'] = json.dumps(reply_markup)
+
         try:
-            response = requests.post(url, json=data, timeout=10)
-            return response.json()
+            response = self.session.post(url, json=data, timeout=10)
+            if parse_response:
+                return response.json()
+            response.close()
+            return response.ok
         except Exception as e:
             print(f"Erro ao enviar mensagem: {e}")
             return None
     
     def load_pending(self):
         """Carrega lista de downloads pendentes"""
-        if not PENDING_FILE.exists():
+        # Arquivo ausente ou só '{}': nem abre o parser
+        if not PENDING_FILE.exists() or PENDING_FILE.stat().st_size <= 2:
             return {}
-        
+
+        if orjson is not None:
+            return orjson.loads(PENDING_FILE.read_bytes())
+
         with open(PENDING_FILE, 'r') as f:
             return json.load(f)
-    
+
+    @property
+    def pending(self):
+        """Lista de pendentes em cache (carrega do disco na primeira leitura)"""
+        if self._pending is None:
+            self._pending = self.load_pending()
+            self._rebuild_index()
+        return self._pending
+
+    @staticmethod
+    def _entry_ts(info):
+        """Timestamp da entrada em epoch.
+
+        Prefere o campo numérico ts_epoch; entradas antigas só com ISO
+        são parseadas uma vez e ganham o campo em cache.
+        """
+        ts = info.get('ts_epoch')
+        if ts is None:
+            from datetime import datetime
+            ts = datetime.fromisoformat(info['timestamp']).timestamp()
+            info['ts_epoch'] = ts
+        return ts
+
+    def _rebuild_index(self):
+        """Reconstrói o índice por status a partir do cache.
+
+        A lista de não-confirmados fica ordenada por timestamp epoch
+        para permitir busca binária do cutoff em cleanup_expired.
+        """
+        confirmed = []
+        pending_sorted = []
+        for video_id, info in (self._pending or {}).items():
+            if info.get('confirmed'):
+                confirmed.append(video_id)
+            else:
+                pending_sorted.append((self._entry_ts(info), video_id))
+
+        pending_sorted.sort()
+        self._by_status = {
+            'confirmed': confirmed,
+            'pending_sorted_by_ts': pending_sorted
+        }
+
     def save_pending(self, data):
-        """Salva lista de downloads pendentes"""
-        with open(PENDING_FILE, 'w') as f:
-            json.dump(data, f, indent=2)
+        """Salva lista de downloads pendentes (escrita atômica via rename).
+
+        O arquivo é lido por máquina; o formato compacto corta ~metade
+        dos bytes escritos. PENDING_PRETTY=1 reativa o indent para
+        depuração.
+        """
+        pretty = bool(os.environ.get('PENDING_PRETTY'))
+        if orjson is not None:
+            option = orjson.OPT_INDENT_2 if pretty else 0
+            payload = orjson.dumps(data, option=option)
+        elif pretty:
+            payload = json.dumps(data, indent=2).encode()
+        else:
+            payload = json.dumps(data, separators=(',', ':')).encode()
+
+        # Nada mudou desde a última escrita: evita rename + fsync à toa
+        digest = hashlib.blake2b(payload, digest_size=16).digest()
+        if digest == self._last_hash:
+            return
+
+        tmp = PENDING_FILE.with_suffix('.json.tmp')
+        try:
+            with open(tmp, 'wb') as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            # rename atômico: leitores nunca veem arquivo pela metade
+            os.replace(tmp, PENDING_FILE)
+            self._last_hash = digest
+        except Exception:
+            try:
+                os.unlink(tmp)
+            except FileNotFoundError:
+                pass
+            raise
+
+    def _locked_update(self, mutator):
+        """Executa load -> mutator(pending) -> save sob lock exclusivo.
+
+        O lock fica num arquivo .lock separado (não no próprio JSON, que
+        troca de inode a cada rename atômico). Serializa invocações
+        concorrentes do gerenciador sem perder entradas.
+        """
+        LOCK_FILE.parent.mkdir(exist_ok=True)
+        fd = os.open(LOCK_FILE, os.O_CREAT | os.O_RDWR)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+
+            # Recarrega dentro do lock para enxergar escritas concorrentes
+            self._pending = self.load_pending()
+            self._rebuild_index()
+            result = mutator(self._pending)
+            self.save_pending(self._pending)
+            self._rebuild_index()
+            return result
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+            os.close(fd)
     
     def list_pending(self):
         """Lista todos os downloads pendentes"""
-        pending = self.load_pending()
+        pending = self.pending
         
         if not pending:
             message = "✅ <b>Nenhum download pendente</b>\n\nTodos os vídeos foram confirmados!"
             self.send_message(message)
             return
         
-        message = f"📋 <b>DOWNLOADS PENDENTES</b>\n\n"
-        message += f"Total: {len(pending)} vídeo(s)\n\n"
-        
+        # Acumula numa lista e junta no final (evita concatenação O(N²))
+        parts = [
+            "📋 <b>DOWNLOADS PENDENTES</b>\n\n",
+            f"Total: {len(pending)} vídeo(s)\n\n"
+        ]
+
+        # Um único snapshot do relógio para todas as idades
+        now = time.time()
+
         for video_id, info in pending.items():
-            timestamp = datetime.fromisoformat(info['timestamp'])
-            age = datetime.now() - timestamp
-            
+            age = now - self._entry_ts(info)
+
             status = "✅ Confirmado" if info.get('confirmed') else "⏳ Aguardando"
-            
-            message += f"🎬 <b>{info['title']}</b>\n"
-            message += f"🆔 ID: <code>{video_id}</code>\n"
-            message += f"📦 Tamanho: {info['size_mb']:.1f}MB\n"
-            message += f"⏰ Criado: {age.days}d {age.seconds//3600}h atrás\n"
-            message += f"📊 Status: {status}\n"
-            message += f"🔗 <a href='{info['download_url']}'>Download</a>\n"
-            message += "─────────────────\n\n"
-        
-        # Adiciona botões de ação
-        keyboard = {
-            "inline_keyboard": [
-                [{"text": "🗑️ Limpar Confirmados", "callback_data": "cleanup_confirmed"}],
-                [{"text": "⚠️ Limpar Expirados (>24h)", "callback_data": "cleanup_expired"}]
-            ]
-        }
+
+            parts.append(_ENTRY_TMPL.format_map({
+                'title': info['title'],
+                'vid': video_id,
+                'size': info['size_mb'],
+                'd': int(age // 86400),
+                'h': int(age % 86400 // 3600),
+                'status': status,
+                'url': info['download_url']
+            }))
+
+        message = ''.join(parts)
         
-        self.send_message(message, keyboard)
+        # Adiciona botões de ação (teclado pré-serializado)
+        self.send_message(message, _CLEANUP_KEYBOARD_JSON)
     
+    @staticmethod
+    def _unlink_batch(directory, names):
+        """Remove um lote de arquivos de um mesmo diretório via dir_fd"""
+        try:
+            dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        except OSError as e:
+            print(f"⚠️ Erro ao abrir diretório {directory}: {e}")
+            return
+
+        try:
+            for name in names:
+                try:
+                    os.unlink(name, dir_fd=dir_fd)
+                    print(f"🗑️ Removido: {os.path.join(directory, name)}")
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    print(f"⚠️ Erro ao remover {name}: {e}")
+        finally:
+            os.close(dir_fd)
+
+    def _remove_files(self, paths):
+        """Remove arquivos em lote, agrupados por diretório.
+
+        Abre cada diretório uma única vez e usa unlink com dir_fd, em vez
+        de um lookup completo de caminho por arquivo. Arquivos já
+        removidos não são erro (sem stat prévio). Os lotes rodam em
+        paralelo num ThreadPoolExecutor: unlink é I/O e libera o GIL.
+        """
+        if not paths:
+            return
+
+        by_dir = {}
+        for path in paths:
+            by_dir.setdefault(os.path.dirname(path) or '.', []).append(
+                os.path.basename(path))
+
+        max_workers = min(32, len(by_dir))
+        if max_workers <= 1:
+            for directory, names in by_dir.items():
+                self._unlink_batch(directory, names)
+            return
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(
+                lambda item: self._unlink_batch(*item), by_dir.items()))
+
     def cleanup_confirmed(self):
         """Remove vídeos já confirmados"""
-        pending = self.load_pending()
-        confirmed_count = 0
-        
-        to_remove = []
-        for video_id, info in pending.items():
-            if info.get('confirmed'):
-                video_path = info['video_path']
-                
-                # Remove arquivo se ainda existir
-                if os.path.exists(video_path):
-                    try:
-                        os.remove(video_path)
-                        print(f"🗑️ Removido: {video_path}")
-                    except Exception as e:
-                        print(f"⚠️ Erro ao remover {video_path}: {e}")
-                
-                to_remove.append(video_id)
-                confirmed_count += 1
-        
-        # Remove da lista
-        for video_id in to_remove:
-            del pending[video_id]
-        
-        self.save_pending(pending)
-        
+        def mutate(pending):
+            to_remove = self._by_status['confirmed']
+            paths = [pending[video_id]['video_path'] for video_id in to_remove]
+
+            # Remove arquivos que ainda existirem
+            self._remove_files(paths)
+
+            # Remove da lista
+            for video_id in to_remove:
+                del pending[video_id]
+
+            return len(to_remove)
+
+        confirmed_count = self._locked_update(mutate)
+
         self.send_message(
             f"✅ <b>Limpeza Concluída</b>\n\n"
             f"🗑️ {confirmed_count} vídeo(s) confirmado(s) removido(s)\n"
-            f"📋 {len(pending)} ainda pendente(s)"
+            f"📋 {len(self.pending)} ainda pendente(s)"
         )
     
     def cleanup_expired(self, hours=24):
         """Remove vídeos expirados (>24h sem confirmação)"""
-        pending = self.load_pending()
-        expired_count = 0
-        cutoff = datetime.now() - timedelta(hours=hours)
-        
-        to_remove = []
-        for video_id, info in pending.items():
-            timestamp = datetime.fromisoformat(info['timestamp'])
-            
-            # Se não confirmado e expirado
-            if not info.get('confirmed') and timestamp < cutoff:
-                video_path = info['video_path']
-                
-                # Remove arquivo
-                if os.path.exists(video_path):
-                    try:
-                        os.remove(video_path)
-                        print(f"🗑️ Removido (expirado): {video_path}")
-                    except Exception as e:
-                        print(f"⚠️ Erro: {e}")
-                
-                to_remove.append(video_id)
-                expired_count += 1
-        
-        # Remove da lista
-        for video_id in to_remove:
-            del pending[video_id]
-        
-        self.save_pending(pending)
-        
+        cutoff = time.time() - hours * 3600
+
+        def mutate(pending):
+            # Busca binária do cutoff na lista ordenada por timestamp:
+            # só o prefixo expirado é percorrido
+            by_ts = self._by_status['pending_sorted_by_ts']
+            expired = by_ts[:bisect.bisect_left(by_ts, (cutoff,))]
+
+            paths = [pending[video_id]['video_path'] for _, video_id in expired]
+
+            # Remove arquivos
+            self._remove_files(paths)
+
+            # Remove da lista
+            for _, video_id in expired:
+                del pending[video_id]
+
+            return len(expired)
+
+        expired_count = self._locked_update(mutate)
+
         self.send_message(
             f"⚠️ <b>Limpeza de Expirados</b>\n\n"
             f"🗑️ {expired_count} vídeo(s) expirado(s) removido(s)\n"
             f"⏰ Limite: {hours} horas\n"
-            f"📋 {len(pending)} ainda pendente(s)"
+            f"📋 {len(self.pending)} ainda pendente(s)"
         )
     
+    def confirm_downloads(self, video_ids):
+        """Confirma vários downloads de uma vez, com um único resumo"""
+        from datetime import datetime
+
+        def mutate(pending):
+            removed_ok = []
+            already_gone = []
+            missing = []
+            errors = []
+
+            for video_id in video_ids:
+                if video_id not in pending:
+                    missing.append(video_id)
+                    continue
+
+                info = pending[video_id]
+                video_path = info['video_path']
+
+                # Marca como confirmado
+                info['confirmed'] = True
+                info['confirmed_at'] = datetime.now().isoformat()
+
+                # Remove arquivo (sem stat prévio; a exceção diz se já
+                # estava removido)
+                try:
+                    os.unlink(video_path)
+                    print(f"🗑️ Vídeo removido: {video_path}")
+                    removed_ok.append(info)
+                except FileNotFoundError:
+                    already_gone.append(info)
+                except OSError as e:
+                    errors.append((info, str(e)))
+
+                # Remove da lista
+                del pending[video_id]
+
+            return removed_ok, already_gone, missing, errors
+
+        removed_ok, already_gone, missing, errors = self._locked_update(mutate)
+
+        # Monta um único resumo em vez de uma mensagem por ID
+        parts = []
+
+        if removed_ok or already_gone:
+            confirmed = len(removed_ok) + len(already_gone)
+            parts.append(f"✅ <b>{confirmed} Download(s) Confirmado(s)!</b>\n")
+            for info in removed_ok:
+                parts.append(f"📺 {info['title']} ({info['size_mb']:.1f}MB)")
+            for info in already_gone:
+                parts.append(f"📺 {info['title']} (⚠️ arquivo já removido)")
+            if removed_ok:
+                parts.append("\n🗑️ Vídeo(s) removido(s) do servidor")
+
+        if errors:
+            parts.append("\n⚠️ <b>Erros ao remover:</b>")
+            for info, error in errors:
+                parts.append(f"• {info['title']}: {error}")
+
+        if missing:
+            parts.append("\n❌ <b>IDs não encontrados:</b>")
+            for video_id in missing:
+                parts.append(f"• <code>{video_id}</code>")
+            parts.append("\nUse /list para ver downloads pendentes.")
+
+        self.send_message("\n".join(parts))
+
+        return not missing and not errors
+
     def confirm_download(self, video_id):
         """Confirma download manualmente via ID"""
-        pending = self.load_pending()
-        
-        if video_id not in pending:
-            self.send_message(
-                "❌ <b>ID Inválido</b>\n\n"
-                f"Vídeo <code>{video_id}</code> não encontrado.\n\n"
-                "Use /list para ver downloads pendentes."
-            )
-            return False
-        
-        info = pending[video_id]
-        video_path = info['video_path']
-        
-        # Marca como confirmado
-        info['confirmed'] = True
-        info['confirmed_at'] = datetime.now().isoformat()
-        
-        # Remove arquivo
-        if os.path.exists(video_path):
-            try:
-                os.remove(video_path)
-                print(f"🗑️ Vídeo removido: {video_path}")
-                
-                self.send_message(
-                    "✅ <b>Download Confirmado!</b>\n\n"
-                    f"📺 {info['title']}\n"
-                    f"📦 {info['size_mb']:.1f}MB\n\n"
-                    "🗑️ Vídeo removido do servidor"
-                )
-            except Exception as e:
-                self.send_message(f"⚠️ Erro ao remover: {e}")
-        else:
-            self.send_message("⚠️ Arquivo já removido")
-        
-        # Remove da lista
-        del pending[video_id]
-        self.save_pending(pending)
-        
-        return True
+        return self.confirm_downloads([video_id])
+
+
+# Despacho de comandos da CLI: comando -> callable(manager, argv)
+COMMANDS = {
+    "list": lambda m, argv: m.list_pending(),
+    "cleanup": lambda m, argv: m.cleanup_confirmed(),
+    "expired": lambda m, argv: m.cleanup_expired(),
+    "confirm": lambda m, argv: (
+        m.confirm_downloads(argv[2:]) if len(argv) >= 3
+        else print("Faltou o ID do vídeo!")
+    ),
+}
 
 
 def main():
     """Função principal - pode ser chamada via GitHub Actions"""
     import sys
-    
-    manager = DownloadManager()
-    
+
     if len(sys.argv) < 2:
         print("Uso: python manage_downloads.py [list|cleanup|confirm|expired]")
         print("  list     - Lista downloads pendentes")
         print("  cleanup  - Remove downloads confirmados")
         print("  expired  - Remove downloads expirados (>24h)")
-        print("  confirm ID - Confirma download por ID")
+        print("  confirm ID [ID...] - Confirma download(s) por ID")
         return
-    
+
     command = sys.argv[1].lower()
-    
-    if command == "list":
-        manager.list_pending()
-    
-    elif command == "cleanup":
-        manager.cleanup_confirmed()
-    
-    elif command == "expired":
-        manager.cleanup_expired()
-    
-    elif command == "confirm" and len(sys.argv) == 3:
-        video_id = sys.argv[2]
-        manager.confirm_download(video_id)
-    
-    else:
-        print("Comando inválido!")
+
+    # Fast path: listar sem nada pendente não precisa nem de rede
+    if command == "list" and (
+            not PENDING_FILE.exists() or PENDING_FILE.stat().st_size <= 2):
+        print("✅ Nenhum download pendente")
+        return
+
+    manager = DownloadManager()
+
+    try:
+        handler = COMMANDS.get(command, lambda m, argv: print("Comando inválido!"))
+        handler(manager, sys.argv)
+    finally:
+        manager.close()
 
 
 if __name__ == '__main__':
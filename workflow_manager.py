@@ -11,9 +11,23 @@ import os
 import json
 import time
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import sys
-from datetime import datetime, timedelta
+from datetime import datetime
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 # Configuration
 TELEGRAM_BOT_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN')
@@ -26,6 +40,84 @@ PRODUCTIONS_DIR.mkdir(exist_ok=True)
 # Cancel flag file
 CANCEL_FLAG_FILE = Path('productions/cancel_flag.json')
 
+# Pending downloads state (o .lock é um sidecar do .json)
+PENDING_FILE = Path('productions/pending_downloads.json')
+PENDING_LOCK_FILE = Path('productions/pending_downloads.lock')
+
+# Duração do long poll no getUpdates. O runner do Actions não aceita
+# conexões de entrada, então webhook não é opção; segurar a conexão o
+# máximo que o Telegram permite é o que minimiza requests ociosos.
+LONG_POLL_TIMEOUT = 50
+
+# Comandos reconhecidos nos loops de polling (frozenset: membership O(1),
+# alocado uma vez no import)
+_CANCEL_CMDS = frozenset({'/cancel', '/cancelar', 'cancel', 'cancelar'})
+_DONE_CMDS = frozenset({'PRONTO', 'DONE', 'FIM', 'FINISH'})
+
+# Templates de mensagem fixos, montados uma vez no import. Os métodos só
+# interpolam o que de fato varia.
+INTRO_BANNER = (
+    "🎬 <b>Produção Diária de Vídeo WWII</b>\n\n"
+    "Vamos criar um novo vídeo histórico!\n\n"
+    "Responda às próximas perguntas para começar.\n"
+    "⏱️ Você tem 10 minutos para cada resposta.\n\n"
+    "🛑 Use <b>/cancel</b> a qualquer momento para cancelar"
+)
+
+TITULO_PROMPT = (
+    "1️⃣ <b>TÍTULO DO VÍDEO</b>\n\n"
+    "Envie o título do seu vídeo sobre WWII.\n\n"
+    "<i>Exemplo: The Forgotten Heroes of D-Day</i>\n\n"
+    "💡 Ou envie /cancel para cancelar"
+)
+
+DESCRICAO_PROMPT = (
+    "2️⃣ <b>DESCRIÇÃO DO VÍDEO</b>\n\n"
+    "Envie a descrição que aparecerá no YouTube.\n\n"
+    "<i>Pode ser de 2 a 3 parágrafos explicando o conteúdo.</i>\n\n"
+    "💡 Ou envie /cancel para cancelar"
+)
+
+TAGS_PROMPT = (
+    "3️⃣ <b>TAGS DO VÍDEO</b>\n\n"
+    "Envie as tags separadas por vírgula.\n\n"
+    "<i>Exemplo: WWII, D-Day, History, Documentary, Normandy</i>\n\n"
+    "💡 Ou envie /cancel para cancelar"
+)
+
+ROTEIRO_INSTRUCTIONS = (
+    "4️⃣ <b>ROTEIRO DE NARRAÇÃO</b>\n\n"
+    "Você pode enviar de 2 formas:\n\n"
+    "📝 <b>Opção 1: Texto Direto</b>\n"
+    "Cole o roteiro como mensagem(ns).\n"
+    "Se for longo, envie em partes e digite: <b>PRONTO</b>\n\n"
+    "📄 <b>Opção 2: Arquivo TXT (RECOMENDADO)</b>\n"
+    "Envie arquivo .txt como documento.\n"
+    "Sem limite de tamanho!\n\n"
+    "💡 Ou digite /cancel para cancelar"
+)
+
+HELP_TEXT = """
+📚 <b>COMANDOS DISPONÍVEIS</b>
+
+<b>📥 Downloads:</b>
+/downloads - Lista downloads pendentes
+/confirm ID - Confirma download do vídeo
+/cleanup - Remove downloads confirmados
+
+<b>🎬 Produção:</b>
+/cancel - Cancela produção atual
+/help - Mostra esta ajuda
+
+<b>💡 Exemplos:</b>
+• <code>/downloads</code> - Ver lista
+• <code>/confirm download_1737123456</code> - Confirmar
+• <code>/cleanup</code> - Limpar confirmados
+
+<b>⚙️ Automático:</b>
+Vídeos expiram em 24h e são removidos automaticamente.
+"""
+
 class WorkflowCancelled(Exception):
     """Exception raised when workflow is cancelled by user"""
     pass
@@ -36,14 +128,87 @@ class TelegramCollector:
     def __init__(self):
         self.base_url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}"
         self.chat_id = TELEGRAM_CHAT_ID
+
+        # Sessão única com keep-alive: todas as chamadas à API reusam a
+        # mesma conexão TLS em vez de refazer o handshake a cada request
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=8,
+            max_retries=Retry(
+                total=3,
+                backoff_factor=0.3,
+                status_forcelist=[429, 500, 502, 503, 504]
+            )
+        )
+        self.session.mount('https://', adapter)
+        self.session.headers.update({'Connection': 'keep-alive'})
+
+        # Sessão separada para download de arquivos (outro host/pool)
+        self.file_session = requests.Session()
+
+        # Executor para envios que não precisam bloquear o polling
+        # (lembretes, confirmações de parte recebida)
+        self._sender = ThreadPoolExecutor(max_workers=2)
+
         self.update_offset = self._get_last_update_id()
         self.cancelled = False
+
+        # Cache (TTL 1s) do stat da flag de cancelamento externa
+        self._cancel_check_ts = float('-inf')
+        self._cancel_flag_seen = False
+
+        # Cache em memória de pending_downloads.json para leituras;
+        # mutações recarregam e salvam sob lock em _locked_update
+        self._pending_cache = None
+
+        # Coalescência de mensagens: dentro de batched_messages() os
+        # send_message viram um buffer despachado em poucas requisições
+        self._batching = False
+        self._outbox = []
+
+        # Tabela de comandos: despacho O(1) em handle_download_commands
+        self._cmd_table = {
+            '/downloads': lambda arg: self.list_pending_downloads(),
+            '/list': lambda arg: self.list_pending_downloads(),
+            '/confirm': self._cmd_confirm,
+            '/cleanup': lambda arg: self.cleanup_confirmed_downloads(),
+            '/help': lambda arg: self.show_help(),
+        }
+        self._register_commands()
     
+    def _register_commands(self):
+        """Registra os comandos no Telegram (autocomplete no cliente)"""
+        try:
+            self.session.post(f"{self.base_url}/setMyCommands", json={
+                'commands': [
+                    {'command': 'downloads',
+                     'description': 'Lista downloads pendentes'},
+                    {'command': 'confirm',
+                     'description': 'Confirma download por ID'},
+                    {'command': 'cleanup',
+                     'description': 'Remove downloads confirmados'},
+                    {'command': 'cancel',
+                     'description': 'Cancela a produção atual'},
+                    {'command': 'help',
+                     'description': 'Mostra a ajuda'},
+                ]
+            }, timeout=5)
+        except Exception as e:
+            print(f"⚠️ Erro ao registrar comandos: {e}")
+
+    def _cmd_confirm(self, arg):
+        """Comando /confirm VIDEO_ID"""
+        if len(arg.split()) == 1:
+            self.confirm_download(arg)
+        else:
+            self.send_message("❌ Uso correto: <code>/confirm VIDEO_ID</code>")
+
     def _get_last_update_id(self):
         """Obtém o último update_id para não processar mensagens antigas"""
         try:
             url = f"{self.base_url}/getUpdates"
-            response = requests.get(url, params={'offset': -1}, timeout=5)
+            response = self.session.get(url, params={'offset': -1}, timeout=5)
             result = response.json()
             
             if result.get('ok') and result.get('result'):
@@ -54,6 +219,10 @@ class TelegramCollector:
     
     def send_message(self, text, reply_markup=None):
         """Envia mensagem para o usuário"""
+        if self._batching:
+            self._outbox.append((text, reply_markup))
+            return True
+
         url = f"{self.base_url}/sendMessage"
         data = {
             'chat_id': self.chat_id,
@@ -64,7 +233,7 @@ class TelegramCollector:
             data['reply_markup'] = json.dumps(reply_markup)
         
         try:
-            response = requests.post(url, json=data, timeout=10)
+            response = self.session.post(url, json=data, timeout=10)
             result = response.json()
             if result.get('ok'):
                 print(f"✅ Mensagem enviada")
@@ -75,94 +244,126 @@ class TelegramCollector:
         except Exception as e:
             print(f"❌ Erro: {e}")
             return False
-    
-    def check_for_cancel(self):
-        """Verifica se usuário enviou comando /cancel"""
+
+    @contextmanager
+    def batched_messages(self):
+        """Coalesce os send_message emitidos dentro do bloco.
+
+        Mensagens consecutivas sem teclado são juntadas numa só (até o
+        limite de 4096 caracteres do Telegram); um lote de N comandos
+        vira 1-2 requisições em vez de N.
+        """
+        self._batching = True
         try:
-            url = f"{self.base_url}/getUpdates"
-            params = {
-                'offset': self.update_offset,
-                'timeout': 0
-            }
-            
-            response = requests.get(url, params=params, timeout=5)
-            result = response.json()
-            
-            if not result.get('ok'):
-                return False
-            
-            updates = result.get('result', [])
-            
-            for update in updates:
-                self.update_offset = update['update_id'] + 1
-                
-                if 'message' in update:
-                    message = update['message']
-                    
-                    if str(message['chat']['id']) != str(self.chat_id):
-                        continue
-                    
-                    text = message.get('text', '').strip().lower()
-                    
-                    if text in ['/cancel', '/cancelar', 'cancel', 'cancelar']:
-                        print("🛑 Comando de cancelamento recebido!")
-                        self.cancelled = True
-                        
-                        cancel_data = {
-                            'cancelled': True,
-                            'timestamp': datetime.now().isoformat(),
-                            'reason': 'User requested cancellation'
-                        }
-                        
-                        with open(CANCEL_FLAG_FILE, 'w') as f:
-                            json.dump(cancel_data, f, indent=2)
-                        
-                        self.send_message(
-                            "🛑 <b>WORKFLOW CANCELADO</b>\n\n"
-                            "A produção foi cancelada com sucesso.\n"
-                            "O workflow será encerrado."
-                        )
-                        
-                        return True
-            
-            return False
-            
-        except Exception as e:
-            print(f"⚠️ Erro ao verificar cancelamento: {e}")
-            return False
-    
-    def wait_for_message(self, timeout=600, check_cancel_interval=5):
-        """Aguarda mensagem do usuário (com verificação de cancelamento)"""
+            yield
+        finally:
+            self._batching = False
+            outbox, self._outbox = self._outbox, []
+            self._flush_outbox(outbox)
+
+    def _flush_outbox(self, outbox):
+        """Despacha o buffer juntando textos consecutivos sem teclado"""
+        batch = []
+        batch_len = 0
+
+        for text, reply_markup in outbox:
+            if reply_markup is not None:
+                # Teclado precisa da própria mensagem: fecha o lote atual
+                if batch:
+                    self.send_message('\n\n'.join(batch))
+                    batch = []
+                    batch_len = 0
+                self.send_message(text, reply_markup)
+                continue
+
+            if batch and batch_len + len(text) + 2 > 4096:
+                self.send_message('\n\n'.join(batch))
+                batch = []
+                batch_len = 0
+
+            batch.append(text)
+            batch_len += len(text) + 2
+
+        if batch:
+            self.send_message('\n\n'.join(batch))
+
+    def send_message_async(self, text, reply_markup=None):
+        """Envia mensagem em background, sem bloquear o loop de polling.
+
+        Para feedback não-crítico (lembretes, acks): o próximo
+        getUpdates sai em paralelo com o envio, em vez de esperar o RTT.
+        """
+        return self._sender.submit(self.send_message, text, reply_markup)
+
+    def _is_cancelled_externally(self):
+        """Flag de cancelamento criada fora deste processo.
+
+        Um stat custa microssegundos, mas o resultado é cacheado por 1s
+        para não bater no filesystem a cada volta do loop.
+        """
+        now = time.monotonic()
+        if now - self._cancel_check_ts >= 1.0:
+            self._cancel_flag_seen = CANCEL_FLAG_FILE.exists()
+            self._cancel_check_ts = now
+        return self._cancel_flag_seen
+
+    def _mark_cancelled(self, reason='User requested cancellation'):
+        """Registra o cancelamento: flag em disco + aviso no chat"""
+        print("🛑 Comando de cancelamento recebido!")
+        self.cancelled = True
+
+        cancel_data = {
+            'cancelled': True,
+            'timestamp': datetime.now().isoformat(),
+            'reason': reason
+        }
+
+        CANCEL_FLAG_FILE.write_text(json.dumps(cancel_data))
+
+        self.send_message("🛑 <b>WORKFLOW CANCELADO</b>")
+
+    def wait_for_message(self, timeout=600):
+        """Aguarda mensagem do usuário via long polling.
+
+        Uma única chamada getUpdates de até LONG_POLL_TIMEOUT segundos
+        por iteração; o /cancel
+        é detectado no mesmo stream de updates, sem poller separado nem
+        sleeps intercalados.
+        """
         print(f"⏳ Aguardando resposta (timeout: {timeout}s)...")
-        
-        start_time = time.time()
-        last_reminder = 0
-        last_cancel_check = 0
-        
-        while time.time() - start_time < timeout:
-            elapsed = time.time() - start_time
-            if elapsed - last_cancel_check >= check_cancel_interval:
-                if self.check_for_cancel():
-                    raise WorkflowCancelled("Workflow cancelled by user")
-                last_cancel_check = elapsed
-            
-            if int(elapsed) // 120 > last_reminder:
-                remaining = int((timeout - elapsed) / 60)
-                self.send_message(
+
+        deadline = time.monotonic() + timeout
+        next_reminder = time.monotonic() + 120
+
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+
+            if time.monotonic() >= next_reminder:
+                self.send_message_async(
                     f"⏰ Ainda aguardando sua resposta...\n"
-                    f"⏱️ {remaining} minutos restantes\n\n"
+                    f"⏱️ {int(remaining / 60)} minutos restantes\n\n"
                     f"💡 Use /cancel para cancelar a produção"
                 )
-                last_reminder = int(elapsed) // 120
-            
+                next_reminder += 120
+
+            # Cancelamento vindo de outro workflow vale na hora, sem
+            # esperar a próxima resposta do long poll
+            if self._is_cancelled_externally():
+                self.cancelled = True
+                raise WorkflowCancelled("Workflow cancelled externally")
+
             try:
                 url = f"{self.base_url}/getUpdates"
                 params = {
                     'offset': self.update_offset,
-                    'timeout': 10
+                    'timeout': min(LONG_POLL_TIMEOUT, max(1, int(remaining))),
+                    'allowed_updates': json.dumps(["message", "callback_query"])
                 }
-                
-                response = requests.get(url, params=params, timeout=15)
+
+                response = self.session.get(url, params=params,
+                                            timeout=LONG_POLL_TIMEOUT + 5)
                 result = response.json()
                 
                 if not result.get('ok'):
@@ -181,17 +382,9 @@ class TelegramCollector:
                             continue
                         
                         text = message.get('text', '').strip()
-                        
-                        if text.lower() in ['/cancel', '/cancelar', 'cancel', 'cancelar']:
-                            self.cancelled = True
-                            cancel_data = {
-                                'cancelled': True,
-                                'timestamp': datetime.now().isoformat()
-                            }
-                            with open(CANCEL_FLAG_FILE, 'w') as f:
-                                json.dump(cancel_data, f, indent=2)
-                            
-                            self.send_message("🛑 <b>WORKFLOW CANCELADO</b>")
+
+                        if text.lower() in _CANCEL_CMDS:
+                            self._mark_cancelled()
                             raise WorkflowCancelled("Workflow cancelled by user")
                         
                         if text:
@@ -207,39 +400,35 @@ class TelegramCollector:
         print("⏰ Timeout - sem resposta")
         return None
     
-    def collect_script_multipart(self, timeout=900):
+    def collect_script_multipart(self, timeout=900, intro=ROTEIRO_INSTRUCTIONS):
         """Coleta roteiro com suporte a múltiplas partes e arquivo TXT"""
         print("\n📝 Coletando roteiro (suporte a múltiplas partes e arquivo)")
-        
-        self.send_message(
-            "4️⃣ <b>ROTEIRO DE NARRAÇÃO</b>\n\n"
-            "Você pode enviar de 2 formas:\n\n"
-            "📝 <b>Opção 1: Texto Direto</b>\n"
-            "Cole o roteiro como mensagem(ns).\n"
-            "Se for longo, envie em partes e digite: <b>PRONTO</b>\n\n"
-            "📄 <b>Opção 2: Arquivo TXT (RECOMENDADO)</b>\n"
-            "Envie arquivo .txt como documento.\n"
-            "Sem limite de tamanho!\n\n"
-            "💡 Ou digite /cancel para cancelar"
-        )
+
+        self.send_message(intro)
         
         roteiro_partes = []
-        start_time = time.time()
-        
-        while time.time() - start_time < timeout:
-            remaining_time = int(timeout - (time.time() - start_time))
-            
+        deadline = time.monotonic() + timeout
+
+        while True:
+            remaining_time = int(deadline - time.monotonic())
+
             if remaining_time <= 0:
                 break
-            
+
+            if self._is_cancelled_externally():
+                self.cancelled = True
+                raise WorkflowCancelled("Workflow cancelled externally")
+
             try:
                 url = f"{self.base_url}/getUpdates"
                 params = {
                     'offset': self.update_offset,
-                    'timeout': min(30, remaining_time)
+                    'timeout': min(LONG_POLL_TIMEOUT, remaining_time),
+                    'allowed_updates': json.dumps(["message", "callback_query"])
                 }
-                
-                response = requests.get(url, params=params, timeout=35)
+
+                response = self.session.get(url, params=params,
+                                            timeout=LONG_POLL_TIMEOUT + 5)
                 result = response.json()
                 
                 if not result.get('ok'):
@@ -271,16 +460,27 @@ class TelegramCollector:
                             try:
                                 file_id = document['file_id']
                                 file_info_url = f"{self.base_url}/getFile"
-                                file_resp = requests.get(file_info_url, params={'file_id': file_id}, timeout=10)
+                                file_resp = self.session.get(file_info_url, params={'file_id': file_id}, timeout=10)
                                 file_data = file_resp.json()
                                 
                                 if file_data.get('ok'):
                                     file_path = file_data['result']['file_path']
                                     download_url = f"https://api.telegram.org/file/bot{TELEGRAM_BOT_TOKEN}/{file_path}"
                                     
-                                    content_resp = requests.get(download_url, timeout=30)
-                                    roteiro_completo = content_resp.text
-                                    
+                                    # Streaming: decodifica por chunks em
+                                    # vez de materializar corpo cru + str
+                                    # (e sem a detecção de encoding do .text)
+                                    with self.file_session.get(
+                                            download_url, stream=True,
+                                            timeout=60) as content_resp:
+                                        content_resp.raise_for_status()
+                                        if content_resp.encoding is None:
+                                            content_resp.encoding = 'utf-8'
+                                        roteiro_completo = ''.join(
+                                            content_resp.iter_content(
+                                                chunk_size=65536,
+                                                decode_unicode=True))
+
                                     return roteiro_completo
                             except Exception as e:
                                 print(f"❌ Erro ao baixar arquivo: {e}")
@@ -294,11 +494,12 @@ class TelegramCollector:
                         continue
                     
                     # Cancelamento
-                    if text.lower() in ['/cancel', '/cancelar', 'cancel', 'cancelar']:
+                    if text.lower() in _CANCEL_CMDS:
+                        self._mark_cancelled()
                         raise WorkflowCancelled("User cancelled")
-                    
+
                     # Finalização
-                    if text.upper() in ['PRONTO', 'DONE', 'FIM', 'FINISH']:
+                    if text.upper() in _DONE_CMDS:
                         if not roteiro_partes:
                             self.send_message("⚠️ Nenhum roteiro foi enviado ainda!")
                             continue
@@ -310,7 +511,7 @@ class TelegramCollector:
                     roteiro_partes.append(text)
                     palavras_atuais = sum(len(p.split()) for p in roteiro_partes)
                     
-                    self.send_message(
+                    self.send_message_async(
                         f"✅ <b>Parte {len(roteiro_partes)} recebida!</b>\n\n"
                         f"📊 Palavras até agora: {palavras_atuais}\n\n"
                         f"➕ Envie mais partes se necessário\n"
@@ -339,58 +540,32 @@ class TelegramCollector:
             if CANCEL_FLAG_FILE.exists():
                 CANCEL_FLAG_FILE.unlink()
             
-            self.send_message(
-                "🎬 <b>Produção Diária de Vídeo WWII</b>\n\n"
-                "Vamos criar um novo vídeo histórico!\n\n"
-                "Responda às próximas perguntas para começar.\n"
-                "⏱️ Você tem 10 minutos para cada resposta.\n\n"
-                "🛑 Use <b>/cancel</b> a qualquer momento para cancelar"
-            )
-            
-            time.sleep(2)
-            
-            # TÍTULO
-            self.send_message(
-                "1️⃣ <b>TÍTULO DO VÍDEO</b>\n\n"
-                "Envie o título do seu vídeo sobre WWII.\n\n"
-                "<i>Exemplo: The Forgotten Heroes of D-Day</i>\n\n"
-                "💡 Ou envie /cancel para cancelar"
-            )
-            
+            # TÍTULO (banner + primeira pergunta em um único envio;
+            # confirmações seguintes vão junto com o próximo prompt,
+            # sem sleeps artificiais entre mensagens)
+            self.send_message(f"{INTRO_BANNER}\n\n{TITULO_PROMPT}")
+
             titulo = self.wait_for_message(timeout=600)
             
             if not titulo:
                 self.send_message("❌ Tempo esgotado. Produção cancelada.")
                 return None
             
-            self.send_message(f"✅ Título recebido!\n\n<b>{titulo}</b>")
-            time.sleep(2)
-            
-            # DESCRIÇÃO
+            # DESCRIÇÃO (confirmação + próximo prompt em um envio)
             self.send_message(
-                "2️⃣ <b>DESCRIÇÃO DO VÍDEO</b>\n\n"
-                "Envie a descrição que aparecerá no YouTube.\n\n"
-                "<i>Pode ser de 2 a 3 parágrafos explicando o conteúdo.</i>\n\n"
-                "💡 Ou envie /cancel para cancelar"
-            )
-            
+                f"✅ Título recebido!\n\n<b>{titulo}</b>\n\n{DESCRICAO_PROMPT}")
+
             descricao = self.wait_for_message(timeout=600)
             
             if not descricao:
                 self.send_message("❌ Tempo esgotado. Produção cancelada.")
                 return None
             
-            self.send_message(f"✅ Descrição recebida!\n\n<i>{descricao[:100]}...</i>")
-            time.sleep(2)
-            
             # TAGS
             self.send_message(
-                "3️⃣ <b>TAGS DO VÍDEO</b>\n\n"
-                "Envie as tags separadas por vírgula.\n\n"
-                "<i>Exemplo: WWII, D-Day, History, Documentary, Normandy</i>\n\n"
-                "💡 Ou envie /cancel para cancelar"
-            )
-            
+                f"✅ Descrição recebida!\n\n<i>{descricao[:100]}...</i>\n\n"
+                f"{TAGS_PROMPT}")
+
             tags_text = self.wait_for_message(timeout=600)
             
             if not tags_text:
@@ -398,11 +573,12 @@ class TelegramCollector:
                 return None
             
             tags = [tag.strip() for tag in tags_text.split(',')]
-            self.send_message(f"✅ Tags recebidas: {len(tags)} tags")
-            time.sleep(2)
-            
-            # ROTEIRO (NOVA FUNÇÃO)
-            roteiro = self.collect_script_multipart(timeout=900)
+
+            # ROTEIRO (confirmação das tags vai junto com as instruções)
+            roteiro = self.collect_script_multipart(
+                timeout=900,
+                intro=(f"✅ Tags recebidas: {len(tags)} tags\n\n"
+                       f"{ROTEIRO_INSTRUCTIONS}"))
             
             if not roteiro:
                 self.send_message("❌ Roteiro não recebido. Produção cancelada.")
@@ -435,8 +611,13 @@ class TelegramCollector:
             }
             
             production_file = PRODUCTIONS_DIR / f"{video_data['video_id']}.json"
-            with open(production_file, 'w', encoding='utf-8') as f:
-                json.dump(video_data, f, indent=2, ensure_ascii=False)
+            if orjson is not None:
+                production_file.write_bytes(
+                    orjson.dumps(video_data, option=orjson.OPT_INDENT_2))
+            else:
+                production_file.write_text(
+                    json.dumps(video_data, indent=2, ensure_ascii=False),
+                    encoding='utf-8')
             
             print(f"\n✅ Informações coletadas: {production_file}")
             
@@ -449,124 +630,227 @@ class TelegramCollector:
     # ==================== FUNÇÕES DE GERENCIAMENTO DE DOWNLOADS ====================
     
     def handle_download_commands(self):
-        """Processa comandos relacionados a downloads"""
+        """Processa comandos relacionados a downloads.
+
+        Long poll: a própria chamada segura a conexão até chegar um
+        update, então o chamador não precisa de loop apertado em volta.
+        """
         try:
             url = f"{self.base_url}/getUpdates"
             params = {
                 'offset': self.update_offset,
-                'timeout': 0
+                'timeout': LONG_POLL_TIMEOUT
             }
-            
-            response = requests.get(url, params=params, timeout=5)
+
+            response = self.session.get(url, params=params,
+                                        timeout=LONG_POLL_TIMEOUT + 5)
             result = response.json()
             
             if not result.get('ok'):
                 return
             
             updates = result.get('result', [])
-            
-            for update in updates:
-                self.update_offset = update['update_id'] + 1
-                
-                # Processa callbacks de botões
-                if 'callback_query' in update:
-                    self.handle_callback(update['callback_query'])
-                    continue
-                
-                if 'message' not in update:
-                    continue
-                
-                message = update['message']
-                
-                if str(message['chat']['id']) != str(self.chat_id):
-                    continue
-                
-                text = message.get('text', '').strip()
-                
-                if not text.startswith('/'):
-                    continue
-                
-                # Comandos de gerenciamento de downloads
-                if text == '/downloads' or text == '/list':
-                    self.list_pending_downloads()
-                
-                elif text.startswith('/confirm '):
-                    parts = text.split()
-                    if len(parts) == 2:
-                        video_id = parts[1]
-                        self.confirm_download(video_id)
-                    else:
-                        self.send_message(
-                            "❌ Uso correto: <code>/confirm VIDEO_ID</code>"
-                        )
-                
-                elif text == '/cleanup':
-                    self.cleanup_confirmed_downloads()
-                
-                elif text == '/help':
-                    self.show_help()
+
+            # Um lote de comandos gera um lote de respostas coalescidas
+            with self.batched_messages():
+                for update in updates:
+                    self.update_offset = update['update_id'] + 1
+
+                    # Processa callbacks de botões
+                    if 'callback_query' in update:
+                        self.handle_callback(update['callback_query'])
+                        continue
+
+                    if 'message' not in update:
+                        continue
+
+                    message = update['message']
+
+                    if str(message['chat']['id']) != str(self.chat_id):
+                        continue
+
+                    text = message.get('text', '').strip()
+
+                    if not text.startswith('/'):
+                        continue
+
+                    # Despacho O(1) pela tabela de comandos
+                    cmd, _, arg = text.partition(' ')
+                    handler = self._cmd_table.get(cmd)
+                    if handler:
+                        handler(arg.strip())
         
         except Exception as e:
             print(f"⚠️ Erro ao processar comandos: {e}")
     
+    def _answer_callback(self, callback_id, text=None, show_alert=False):
+        """Responde um callback de botão inline"""
+        data = {'callback_query_id': callback_id}
+        if text:
+            data['text'] = text
+        if show_alert:
+            data['show_alert'] = True
+
+        self.session.post(f"{self.base_url}/answerCallbackQuery", json=data,
+                          timeout=10)
+
+    def _edit_message(self, message_id, text, reply_markup=None):
+        """Edita uma mensagem existente em vez de acrescentar outra"""
+        data = {
+            'chat_id': self.chat_id,
+            'message_id': message_id,
+            'text': text,
+            'parse_mode': 'HTML'
+        }
+        if reply_markup:
+            data['reply_markup'] = json.dumps(reply_markup)
+
+        try:
+            response = self.session.post(
+                f"{self.base_url}/editMessageText", json=data, timeout=10)
+            return response.ok
+        except Exception as e:
+            print(f"❌ Erro ao editar mensagem: {e}")
+            return False
+
+    def _report(self, text, edit_message_id=None):
+        """Entrega um resumo: edita a mensagem de origem ou envia nova"""
+        if edit_message_id and self._edit_message(edit_message_id, text):
+            return
+        self.send_message(text)
+
     def handle_callback(self, callback):
         """Processa callbacks de botões inline"""
         callback_id = callback['id']
         callback_data = callback.get('data', '')
-        
-        # Responde ao callback
-        confirm_url = f"{self.base_url}/answerCallbackQuery"
-        
+        message_id = callback.get('message', {}).get('message_id')
+
         try:
             if callback_data.startswith('confirm:'):
                 video_id = callback_data.split(':', 1)[1]
-                
-                requests.post(confirm_url, json={
-                    'callback_query_id': callback_id,
-                    'text': 'Processando... ⏳'
-                })
-                
-                self.confirm_download(video_id)
-            
+
+                # A confirmação curta vai na própria resposta do
+                # callback (show_alert): uma chamada em vez de duas
+                result = self.confirm_download(video_id, notify=False)
+                self._answer_callback(callback_id, result[:200],
+                                      show_alert=True)
+
             elif callback_data == 'cleanup_confirmed':
-                requests.post(confirm_url, json={
-                    'callback_query_id': callback_id,
-                    'text': 'Limpando... 🗑️'
-                })
-                
-                self.cleanup_confirmed_downloads()
-            
+                self._answer_callback(callback_id, 'Limpando... 🗑️')
+                self.cleanup_confirmed_downloads(edit_message_id=message_id)
+
             elif callback_data == 'cleanup_expired':
-                requests.post(confirm_url, json={
-                    'callback_query_id': callback_id,
-                    'text': 'Removendo expirados... ⚠️'
-                })
-                
-                self.cleanup_expired_downloads()
-            
+                self._answer_callback(callback_id, 'Removendo expirados... ⚠️')
+                self.cleanup_expired_downloads(edit_message_id=message_id)
+
             else:
-                requests.post(confirm_url, json={
-                    'callback_query_id': callback_id,
-                    'text': 'Comando desconhecido'
-                })
-        
+                self._answer_callback(callback_id, 'Comando desconhecido')
+
         except Exception as e:
             print(f"❌ Erro ao processar callback: {e}")
     
+    @staticmethod
+    @contextmanager
+    def _pending_lock():
+        """Lock exclusivo num arquivo .lock ao lado do JSON de pendentes.
+
+        Serializa este workflow contra um /cleanup ou /confirm rodando
+        em outro job; o lock fica num sidecar porque o JSON troca de
+        inode a cada rename atômico.
+        """
+        fd = os.open(PENDING_LOCK_FILE, os.O_CREAT | os.O_RDWR)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    @staticmethod
+    def _entry_ts(info):
+        """Timestamp da entrada em epoch.
+
+        Prefere o campo numérico ts_epoch gravado na criação; entradas
+        antigas só com ISO são parseadas uma vez e ganham o campo em
+        cache.
+        """
+        ts = info.get('ts_epoch')
+        if ts is None:
+            ts = datetime.fromisoformat(info['timestamp']).timestamp()
+            info['ts_epoch'] = ts
+        return ts
+
+    @staticmethod
+    def _read_pending():
+        """Lê o JSON de pendentes direto do disco (chamar sob lock)"""
+        if not PENDING_FILE.exists():
+            return {}
+        if orjson is not None:
+            return orjson.loads(PENDING_FILE.read_bytes())
+        with open(PENDING_FILE, 'r') as f:
+            return json.load(f)
+
+    @staticmethod
+    def _write_pending(pending):
+        """Persiste via .tmp + os.replace (chamar sob lock).
+
+        Leitores concorrentes nunca veem o JSON pela metade. Compacto
+        por padrão, como nos outros módulos que escrevem este arquivo;
+        PENDING_PRETTY=1 reativa o indent para depuração.
+        """
+        pretty = bool(os.environ.get('PENDING_PRETTY'))
+        if orjson is not None:
+            option = orjson.OPT_INDENT_2 if pretty else 0
+            payload = orjson.dumps(pending, option=option)
+        elif pretty:
+            payload = json.dumps(pending, indent=2).encode()
+        else:
+            payload = json.dumps(pending, separators=(',', ':')).encode()
+
+        tmp = PENDING_FILE.with_suffix('.json.tmp')
+        try:
+            tmp.write_bytes(payload)
+            os.replace(tmp, PENDING_FILE)
+        except Exception:
+            try:
+                os.unlink(tmp)
+            except FileNotFoundError:
+                pass
+            raise
+
+    def _load_pending(self):
+        """Carrega a lista de pendentes (cache por processo, só leitura).
+
+        Mutações não passam por aqui: use _locked_update, que recarrega
+        e salva dentro do mesmo lock.
+        """
+        if self._pending_cache is None:
+            with self._pending_lock():
+                self._pending_cache = self._read_pending()
+        return self._pending_cache
+
+    def _locked_update(self, mutator):
+        """Executa load -> mutator(pending) -> save sob um único lock.
+
+        Recarregar dentro do lock garante que o mutator enxerga escritas
+        de outros jobs (um /confirm e um /cleanup concorrentes, ou o
+        create_video anexando entradas) em vez de regravar um cache
+        velho por cima. O retorno do mutator é repassado ao chamador e
+        o cache local passa a refletir o estado salvo.
+        """
+        with self._pending_lock():
+            pending = self._read_pending()
+            result = mutator(pending)
+            self._write_pending(pending)
+            self._pending_cache = pending
+        return result
+
     def list_pending_downloads(self):
         """Lista downloads pendentes via Telegram"""
-        pending_file = Path('productions/pending_downloads.json')
-        
-        if not pending_file.exists():
-            self.send_message(
-                "✅ <b>Nenhum download pendente</b>\n\n"
-                "Todos os vídeos foram confirmados!"
-            )
-            return
-        
-        with open(pending_file, 'r') as f:
-            pending = json.load(f)
-        
+        pending = self._load_pending()
+
         if not pending:
             self.send_message(
                 "✅ <b>Nenhum download pendente</b>\n\n"
@@ -574,25 +858,34 @@ class TelegramCollector:
             )
             return
         
-        message = f"📋 <b>DOWNLOADS PENDENTES</b>\n\n"
-        message += f"Total: {len(pending)} vídeo(s)\n\n"
-        
+        # Acumula numa lista e junta no final (evita concatenação O(N²))
+        parts = [
+            "📋 <b>DOWNLOADS PENDENTES</b>\n\n",
+            f"Total: {len(pending)} vídeo(s)\n\n"
+        ]
+
+        now = time.time()
+
         for video_id, info in pending.items():
-            timestamp = datetime.fromisoformat(info['timestamp'])
-            age = datetime.now() - timestamp
-            hours_old = age.total_seconds() / 3600
-            
-            status = "✅" if info.get('confirmed') else "⏳"
-            
-            message += f"{status} <b>{info['title']}</b>\n"
-            message += f"🆔 <code>{video_id}</code>\n"
-            message += f"📦 {info['size_mb']:.1f}MB\n"
-            message += f"⏰ {hours_old:.1f}h atrás\n"
-            
-            if not info.get('confirmed'):
-                message += f"📥 <a href='{info['download_url']}'>Download</a>\n"
-            
-            message += "─────────────────\n\n"
+            hours_old = (now - self._entry_ts(info)) / 3600
+            hours_fmt = f"{hours_old:.1f}"
+
+            confirmed = info.get('confirmed')
+            status = "✅" if confirmed else "⏳"
+
+            parts.append(
+                f"{status} <b>{info['title']}</b>\n"
+                f"🆔 <code>{video_id}</code>\n"
+                f"📦 {info['size_mb']:.1f}MB\n"
+                f"⏰ {hours_fmt}h atrás\n"
+            )
+
+            if not confirmed:
+                parts.append(f"📥 <a href='{info['download_url']}'>Download</a>\n")
+
+            parts.append("─────────────────\n\n")
+
+        message = ''.join(parts)
         
         # Botões de ação
         keyboard = {
@@ -604,172 +897,148 @@ class TelegramCollector:
         
         self.send_message(message, keyboard)
     
-    def confirm_download(self, video_id):
-        """Confirma download e remove vídeo"""
-        pending_file = Path('productions/pending_downloads.json')
-        
-        if not pending_file.exists():
-            self.send_message("❌ Nenhum download pendente")
-            return
-        
-        with open(pending_file, 'r') as f:
-            pending = json.load(f)
-        
-        if video_id not in pending:
-            self.send_message(
-                f"❌ <b>ID Inválido</b>\n\n"
-                f"Vídeo <code>{video_id}</code> não encontrado.\n\n"
-                f"Use /downloads para ver IDs disponíveis"
-            )
-            return
-        
-        info = pending[video_id]
-        video_path = info['video_path']
-        
-        # Marca como confirmado
-        info['confirmed'] = True
-        info['confirmed_at'] = datetime.now().isoformat()
-        
-        # Remove arquivo
+    def confirm_download(self, video_id, notify=True):
+        """Confirma download e remove vídeo.
+
+        Com notify=False não envia mensagem; devolve um resumo curto
+        para o chamador usar (ex.: na resposta do callback).
+        """
+        def mutate(pending):
+            if video_id not in pending:
+                return {'found': False, 'empty': not pending}
+            info = pending.pop(video_id)
+            info['confirmed'] = True
+            info['confirmed_at'] = datetime.now().isoformat()
+            return {'found': True, 'info': info, 'remaining': len(pending)}
+
+        outcome = self._locked_update(mutate)
+
+        if not outcome['found']:
+            if outcome['empty']:
+                if notify:
+                    self.send_message("❌ Nenhum download pendente")
+                return "❌ Nenhum download pendente"
+            if notify:
+                self.send_message(
+                    f"❌ <b>ID Inválido</b>\n\n"
+                    f"Vídeo <code>{video_id}</code> não encontrado.\n\n"
+                    f"Use /downloads para ver IDs disponíveis"
+                )
+            return f"❌ Vídeo {video_id} não encontrado"
+
+        info = outcome['info']
+        remaining = outcome['remaining']
+
+        # Remove arquivo fora do lock (um unlink direto; "já removido"
+        # não é erro)
         removed = False
-        if os.path.exists(video_path):
-            try:
-                os.remove(video_path)
-                removed = True
-                print(f"🗑️ Vídeo removido: {video_path}")
-            except Exception as e:
-                print(f"❌ Erro ao remover: {e}")
-        
-        # Remove da lista
-        del pending[video_id]
-        
-        with open(pending_file, 'w') as f:
-            json.dump(pending, f, indent=2)
-        
+        try:
+            Path(info['video_path']).unlink()
+            removed = True
+            print(f"🗑️ Vídeo removido: {info['video_path']}")
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"❌ Erro ao remover: {e}")
+
         if removed:
-            self.send_message(
-                f"✅ <b>Download Confirmado!</b>\n\n"
-                f"📺 {info['title']}\n"
-                f"📦 {info['size_mb']:.1f}MB\n\n"
-                f"🗑️ Vídeo removido do servidor\n"
-                f"📋 {len(pending)} download(s) pendente(s)"
-            )
-        else:
+            if notify:
+                self.send_message(
+                    f"✅ <b>Download Confirmado!</b>\n\n"
+                    f"📺 {info['title']}\n"
+                    f"📦 {info['size_mb']:.1f}MB\n\n"
+                    f"🗑️ Vídeo removido do servidor\n"
+                    f"📋 {remaining} download(s) pendente(s)"
+                )
+            return f"✅ {info['title']} removido"
+
+        if notify:
             self.send_message(
                 f"✅ <b>Confirmado</b>\n\n"
                 f"⚠️ Arquivo já estava removido\n"
-                f"📋 {len(pending)} download(s) pendente(s)"
+                f"📋 {remaining} download(s) pendente(s)"
             )
+        return f"✅ {info['title']} confirmado (arquivo já removido)"
     
-    def cleanup_confirmed_downloads(self):
-        """Remove todos os downloads já confirmados"""
-        pending_file = Path('productions/pending_downloads.json')
-        
-        if not pending_file.exists():
-            self.send_message("✅ Nenhum download para limpar")
+    def cleanup_confirmed_downloads(self, edit_message_id=None):
+        """Remove todos os downloads já confirmados.
+
+        Com edit_message_id, o resumo substitui a mensagem da listagem
+        (editMessageText) em vez de acrescentar outra no chat.
+        """
+        def mutate(pending):
+            if not pending:
+                return None
+            to_remove = [vid for vid, info in pending.items()
+                         if info.get('confirmed')]
+            paths = [pending.pop(vid)['video_path'] for vid in to_remove]
+            return {'paths': paths, 'remaining': len(pending)}
+
+        outcome = self._locked_update(mutate)
+
+        if outcome is None:
+            self._report("✅ Nenhum download para limpar", edit_message_id)
             return
-        
-        with open(pending_file, 'r') as f:
-            pending = json.load(f)
-        
-        confirmed_count = 0
+
         removed_count = 0
-        
-        to_remove = []
-        for video_id, info in pending.items():
-            if info.get('confirmed'):
-                to_remove.append(video_id)
-                confirmed_count += 1
-                
-                video_path = info['video_path']
-                if os.path.exists(video_path):
-                    try:
-                        os.remove(video_path)
-                        removed_count += 1
-                    except Exception as e:
-                        print(f"⚠️ Erro: {e}")
-        
-        for video_id in to_remove:
-            del pending[video_id]
-        
-        with open(pending_file, 'w') as f:
-            json.dump(pending, f, indent=2)
-        
-        self.send_message(
+        for path in outcome['paths']:
+            try:
+                Path(path).unlink()
+                removed_count += 1
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"⚠️ Erro: {e}")
+
+        self._report(
             f"✅ <b>Limpeza Concluída</b>\n\n"
-            f"🗑️ {confirmed_count} confirmado(s) removido(s)\n"
+            f"🗑️ {len(outcome['paths'])} confirmado(s) removido(s)\n"
             f"📁 {removed_count} arquivo(s) deletado(s)\n"
-            f"📋 {len(pending)} ainda pendente(s)"
+            f"📋 {outcome['remaining']} ainda pendente(s)",
+            edit_message_id
         )
     
-    def cleanup_expired_downloads(self, hours=24):
+    def cleanup_expired_downloads(self, hours=24, edit_message_id=None):
         """Remove downloads expirados (>24h sem confirmação)"""
-        pending_file = Path('productions/pending_downloads.json')
-        
-        if not pending_file.exists():
-            self.send_message("✅ Nenhum download para limpar")
+        cutoff = time.time() - hours * 3600
+
+        def mutate(pending):
+            if not pending:
+                return None
+            to_remove = [
+                vid for vid, info in pending.items()
+                if not info.get('confirmed') and self._entry_ts(info) < cutoff
+            ]
+            paths = [pending.pop(vid)['video_path'] for vid in to_remove]
+            return {'paths': paths, 'remaining': len(pending)}
+
+        outcome = self._locked_update(mutate)
+
+        if outcome is None:
+            self._report("✅ Nenhum download para limpar", edit_message_id)
             return
-        
-        with open(pending_file, 'r') as f:
-            pending = json.load(f)
-        
-        cutoff = datetime.now() - timedelta(hours=hours)
-        expired_count = 0
+
         removed_count = 0
-        
-        to_remove = []
-        for video_id, info in pending.items():
-            timestamp = datetime.fromisoformat(info['timestamp'])
-            
-            if not info.get('confirmed') and timestamp < cutoff:
-                to_remove.append(video_id)
-                expired_count += 1
-                
-                video_path = info['video_path']
-                if os.path.exists(video_path):
-                    try:
-                        os.remove(video_path)
-                        removed_count += 1
-                    except Exception as e:
-                        print(f"⚠️ Erro: {e}")
-        
-        for video_id in to_remove:
-            del pending[video_id]
-        
-        with open(pending_file, 'w') as f:
-            json.dump(pending, f, indent=2)
-        
-        self.send_message(
+        for path in outcome['paths']:
+            try:
+                Path(path).unlink()
+                removed_count += 1
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"⚠️ Erro: {e}")
+
+        self._report(
             f"⚠️ <b>Limpeza de Expirados</b>\n\n"
-            f"🗑️ {expired_count} expirado(s) (>{hours}h)\n"
+            f"🗑️ {len(outcome['paths'])} expirado(s) (>{hours}h)\n"
             f"📁 {removed_count} arquivo(s) deletado(s)\n"
-            f"📋 {len(pending)} ainda pendente(s)"
+            f"📋 {outcome['remaining']} ainda pendente(s)",
+            edit_message_id
         )
     
     def show_help(self):
         """Mostra ajuda com comandos disponíveis"""
-        help_text = """
-📚 <b>COMANDOS DISPONÍVEIS</b>
-
-<b>📥 Downloads:</b>
-/downloads - Lista downloads pendentes
-/confirm ID - Confirma download do vídeo
-/cleanup - Remove downloads confirmados
-
-<b>🎬 Produção:</b>
-/cancel - Cancela produção atual
-/help - Mostra esta ajuda
-
-<b>💡 Exemplos:</b>
-• <code>/downloads</code> - Ver lista
-• <code>/confirm download_1737123456</code> - Confirmar
-• <code>/cleanup</code> - Limpar confirmados
-
-<b>⚙️ Automático:</b>
-Vídeos expiram em 24h e são removidos automaticamente.
-"""
-        
-        self.send_message(help_text)
+        self.send_message(HELP_TEXT)
 
 
 def main():